@@ -1,11 +1,17 @@
 import argparse
 import fnmatch
+import functools
+import hashlib
 import logging
+import mmap
 import re
 import os
 import shutil
+import string
 import subprocess
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import List, Set, Dict, Tuple, Optional
@@ -85,6 +91,36 @@ EXCLUDE_DIRS: Set[str] = {
     '*aider*', '.tree_map_backup'
 }
 
+# Pre-compiled matchers for the exclusion sets. Most patterns are plain
+# literal names (.git, node_modules, .DS_Store, ...), which go into a
+# frozenset for an O(1) hash lookup; only patterns with glob metacharacters
+# need the union regex, translated once at import time and joined into a
+# single case-insensitive alternation.
+_GLOB_CHARS = frozenset('*?[')
+
+def _partition_patterns(patterns: Set[str]) -> Tuple[frozenset, re.Pattern]:
+    literals = frozenset(p.lower() for p in patterns if not _GLOB_CHARS & set(p))
+    globs = [p for p in patterns if _GLOB_CHARS & set(p)]
+    regex = re.compile(
+        '|'.join(f'(?:{fnmatch.translate(pattern.lower())})' for pattern in globs) or r'(?!)',
+        re.IGNORECASE,
+    )
+    return literals, regex
+
+_DIR_LITERALS, _DIR_RE = _partition_patterns(EXCLUDE_DIRS)
+_FILE_LITERALS, _FILE_RE = _partition_patterns(EXCLUDE_FILES)
+
+# The exclusion patterns are all ASCII, so the literal-set lookups can fold
+# case with a plain translation table and skip str.lower()'s Unicode
+# machinery; the regex side needs no folding at all thanks to IGNORECASE.
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def _excluded_dir_name(name: str) -> bool:
+    return name.translate(_ASCII_LOWER) in _DIR_LITERALS or _DIR_RE.match(name) is not None
+
+def _excluded_file_name(name: str) -> bool:
+    return name.translate(_ASCII_LOWER) in _FILE_LITERALS or _FILE_RE.match(name) is not None
+
 # Default comment style for unknown file types
 DEFAULT_COMMENT_STYLE = ('#', '#', '')
 
@@ -129,6 +165,9 @@ COMMENT_STYLES: Dict[str, Tuple[str, str, str]] = {
 }
 
 class Metrics:
+    __slots__ = ('start_time', 'files_processed', 'files_modified', 'files_skipped',
+                 'backup_size', 'errors', 'map_file_saved', 'map_file_location')
+
     def __init__(self):
         self.start_time = time.time()
         self.files_processed = 0
@@ -154,106 +193,231 @@ class Metrics:
         print(f"Errors encountered: {self.errors}")
         print(f"Total execution time: {duration:.2f} seconds")
 
-def should_exclude(path: Path, relative_to: Path) -> bool:
-    """Check if a file or directory should be excluded (case-insensitive)."""
-    relative_path = path.relative_to(relative_to)
-    parts = relative_path.parts
+# Guards Metrics mutations made directly from worker threads (e.g. in
+# create_backup); the main counters are aggregated from worker results.
+_metrics_lock = threading.Lock()
+
+def should_exclude_parts(parts: Tuple[str, ...], is_file: bool, name: str) -> bool:
+    """Check relative path parts against the exclusion sets (case-insensitive).
 
+    Takes the parts directly so callers that already hold them (the walker,
+    or anything that computed a relative path) avoid building a new
+    PurePath and parts tuple per check.
+    """
     # Check each part of the path against exclusion patterns (case-insensitive)
     for part in parts:
-        if any(fnmatch.fnmatch(part.lower(), pattern.lower()) for pattern in EXCLUDE_DIRS):
+        if _excluded_dir_name(part):
             return True
 
     # Check the file name against file exclusion patterns (case-insensitive)
-    if path.is_file():
-        return any(fnmatch.fnmatch(path.name.lower(), pattern.lower()) for pattern in EXCLUDE_FILES)
+    if is_file:
+        return _excluded_file_name(name)
 
     return False
 
+def should_exclude(path: Path, relative_to: Path) -> bool:
+    """Check if a file or directory should be excluded (case-insensitive)."""
+    parts = path.relative_to(relative_to).parts
+    return should_exclude_parts(parts, path.is_file(), path.name)
+
+def _walk(startpath: Path):
+    """Yield (Path, str) pairs for non-excluded files under startpath.
+
+    Uses os.scandir so directory/file checks come from the cached DirEntry
+    metadata, and excluded directories are skipped before descending into
+    them instead of being discarded after the fact. The string form comes
+    straight from the DirEntry, so downstream consumers (backup, git)
+    never have to re-stringify the Path.
+    """
+    stack = [str(startpath)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not _excluded_dir_name(entry.name):
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        if not _excluded_file_name(entry.name):
+                            yield Path(entry.path), entry.path
+        except OSError as e:
+            logger.warning(f"Cannot scan directory {current}: {e}")
+
+@functools.lru_cache(maxsize=128)
 def get_comment_style(file_extension: str) -> Tuple[str, str, str]:
     """Get the appropriate comment style for a given file extension."""
     return COMMENT_STYLES.get(file_extension.lstrip('.'), DEFAULT_COMMENT_STYLE)
 
+@functools.lru_cache(maxsize=128)
+def _map_template(comment_start: str, comment_middle: str, comment_end: str, tree: str) -> Tuple[str, str]:
+    """Build the map text surrounding the per-file name for one comment style.
+
+    The tree is identical for every file in a run, so everything except the
+    file name is assembled once per comment style instead of once per file.
+    """
+    body = '\n'.join(f"{comment_middle} {line}" for line in tree.split('\n'))
+    prefix = f"{comment_start} Repository Map:\n{body}\n{comment_middle} File: "
+    suffix = f"\n{comment_end}\n" if comment_end else "\n"
+    return prefix, suffix
+
+@functools.lru_cache(maxsize=None)
+def _compiled_map_pattern(comment_start: str, comment_middle: str, comment_end: str) -> re.Pattern:
+    """Compile the pattern matching an existing map for one comment style.
+
+    Only a handful of distinct comment styles exist, so caching per style
+    avoids rebuilding and re-parsing the pattern for every file.
+    """
+    map_pattern = rf'({re.escape(comment_start)} Repository Map:.*?{re.escape(comment_middle)} File:.*?\n)'
+    if comment_end:
+        map_pattern += rf'({re.escape(comment_end)}\s*)'
+    return re.compile(map_pattern, re.DOTALL)
+
 def is_binary_file(filepath: Path) -> bool:
-    """Check if a file is binary."""
+    """Check if a file is binary by sniffing the first 8 KB for NUL bytes.
+
+    This is the same heuristic git uses and avoids decoding the whole
+    file just to detect binary content.
+    """
     try:
-        with open(filepath, 'tr') as check_file:
-            check_file.read()
-            return False
-    except:
+        with open(filepath, 'rb') as check_file:
+            chunk = check_file.read(8192)
+        return b'\x00' in chunk
+    except OSError:
         return True
 
-def update_files_with_tree(startpath: Path, tree: str, backup_dir: Optional[Path]) -> List[Path]:
-    modified_files = []
-    for filepath in startpath.rglob('*'):
-        logger.debug(f"Processing file: {filepath}")
-        
-        if should_exclude(filepath, startpath):
-            logger.info(f"Skipping excluded path: {filepath}")
-            metrics.files_skipped += 1
-            continue
-
-        if filepath.is_file():
-            metrics.files_processed += 1
-            
-            if is_binary_file(filepath):
-                logger.info(f"Skipping binary file: {filepath}")
-                metrics.files_skipped += 1
-                continue
-            
+def _process_one(filepath: Path, filepath_str: str, tree: str, backup_dir: Optional[Path], startpath: Path) -> Tuple[Optional[str], Dict[str, int]]:
+    """Update the repository map in a single file.
+
+    Worker for the thread pool in update_files_with_tree. Returns the file
+    path string if it was modified (None otherwise) and a dict of metrics deltas
+    so counters can be aggregated without cross-thread mutation.
+    """
+    stats = {'files_processed': 1, 'files_modified': 0, 'files_skipped': 0, 'errors': 0}
+
+    if is_binary_file(filepath):
+        logger.info(f"Skipping binary file: {filepath}")
+        stats['files_skipped'] += 1
+        return None, stats
+
+    try:
+        backup_successful = True
+        if backup_dir:
+            logger.debug(f"Attempting to create backup for: {filepath}")
+            backup_path = create_backup(filepath, backup_dir, startpath, filepath_str)
+            if not backup_path:
+                logger.warning(f"Failed to create backup for {filepath}, proceeding without backup")
+                backup_successful = False
+            else:
+                logger.info(f"Backup created successfully for: {filepath}")
+
+        comment_start, comment_middle, comment_end = get_comment_style(filepath.suffix)
+
+        # Create the updated map as a single unit
+        map_prefix, map_suffix = _map_template(comment_start, comment_middle, comment_end, tree)
+        updated_map = map_prefix + filepath.name + map_suffix
+
+        # Look for the map marker near the top of the file at the byte level
+        # before paying for a full UTF-8 decode; maps are always inserted at
+        # the beginning, so 4 KB is plenty.
+        marker = f"{comment_start} Repository Map:".encode('utf-8')
+        expected_map = updated_map.encode('utf-8')
+        with open(filepath, 'rb') as f:
             try:
-                backup_successful = True
-                if backup_dir:
-                    logger.debug(f"Attempting to create backup for: {filepath}")
-                    backup_path = create_backup(filepath, backup_dir, startpath)
-                    if not backup_path:
-                        logger.warning(f"Failed to create backup for {filepath}, proceeding without backup")
-                        backup_successful = False
-                    else:
-                        logger.info(f"Backup created successfully for: {filepath}")
-
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    content = f.read()
-
-                comment_start, comment_middle, comment_end = get_comment_style(filepath.suffix)
-                
-                # Create the updated map as a single unit
-                updated_map = f"{comment_start} Repository Map:\n"
-                for line in tree.split('\n'):
-                    updated_map += f"{comment_middle} {line}\n"
-                updated_map += f"{comment_middle} File: {filepath.name}\n"
-                if comment_end:
-                    updated_map += f"{comment_end}\n"
-
-                # Pattern to match the entire existing map, including the "File:" line
-                map_pattern = rf'({re.escape(comment_start)} Repository Map:.*?{re.escape(comment_middle)} File:.*?\n)'
-                if comment_end:
-                    map_pattern += rf'({re.escape(comment_end)}\s*)'
-
-                if re.search(map_pattern, content, re.DOTALL):
-                    # Replace the existing map while preserving all other content
-                    updated_content, n = re.subn(map_pattern, updated_map, content, count=1, flags=re.DOTALL)
-                    if n == 0:  # If no substitution was made (shouldn't happen, but just in case)
-                        updated_content = updated_map + content
-                else:
-                    # Add the new map at the beginning of the file, preserving all existing content
-                    updated_content = updated_map + content
-
-                if updated_content != content:
-                    with open(filepath, 'w', encoding='utf-8') as f:
-                        f.write(updated_content)
-                    modified_files.append(filepath)
-                    metrics.files_modified += 1
-                    logger.info(f"Updated repo map in {filepath}")
-                    if not backup_successful:
-                        logger.warning(f"File {filepath} was updated without a backup")
-                else:
-                    logger.info(f"No changes needed for {filepath}")
-                    metrics.files_skipped += 1
-            except Exception as e:
-                logger.error(f"Error processing {filepath}: {str(e)}")
-                metrics.errors += 1
-                metrics.files_skipped += 1
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file cannot be mapped
+                mm = None
+            if mm is not None:
+                with mm:
+                    # Fast path for re-runs: the file already starts with
+                    # exactly the map we would write, so there is nothing
+                    # to decode, substitute, or rewrite.
+                    if mm[:len(expected_map)] == expected_map:
+                        logger.info(f"No changes needed for {filepath}")
+                        stats['files_skipped'] += 1
+                        return None, stats
+                    has_map = mm.find(marker, 0, 4096) != -1
+                    raw = mm[:]
+            else:
+                has_map = False
+                raw = b''
+
+        if not has_map:
+            # Add the new map at the beginning of the file, preserving all
+            # existing content, without decoding it.
+            with open(filepath, 'wb') as f:
+                f.write(updated_map.encode('utf-8') + raw)
+            stats['files_modified'] += 1
+            logger.info(f"Updated repo map in {filepath}")
+            if not backup_successful:
+                logger.warning(f"File {filepath} was updated without a backup")
+            return filepath_str, stats
+
+        content = raw.decode('utf-8')
+
+        # Pattern to match the entire existing map, including the "File:" line
+        map_pattern = _compiled_map_pattern(comment_start, comment_middle, comment_end)
+
+        # Replace the existing map while preserving all other content
+        updated_content, n = map_pattern.subn(updated_map, content, count=1)
+        if n == 0:  # If no substitution was made (shouldn't happen, but just in case)
+            updated_content = updated_map + content
+
+        if updated_content != content:
+            # Write through the same binary path as the no-map branch; a
+            # text-mode write would re-translate the \r\n sequences the raw
+            # decode preserved, corrupting CRLF files.
+            with open(filepath, 'wb') as f:
+                f.write(updated_content.encode('utf-8'))
+            stats['files_modified'] += 1
+            logger.info(f"Updated repo map in {filepath}")
+            if not backup_successful:
+                logger.warning(f"File {filepath} was updated without a backup")
+            return filepath_str, stats
+        else:
+            logger.info(f"No changes needed for {filepath}")
+            stats['files_skipped'] += 1
+    except Exception as e:
+        logger.error(f"Error processing {filepath}: {str(e)}")
+        stats['errors'] += 1
+        stats['files_skipped'] += 1
+
+    return None, stats
+
+def update_files_with_tree(startpath: Path, tree: str, backup_dir: Optional[Path],
+                           files: Optional[List[Tuple[Path, str]]] = None) -> List[str]:
+    """Update all eligible files under startpath with the repository map.
+
+    Each file is independent and the work is dominated by blocking file
+    I/O, so files are processed concurrently in a thread pool. Callers that
+    have already walked the tree (e.g. for the preview) can pass the
+    candidate (Path, str) pairs to avoid a second traversal.
+    """
+    if files is None:
+        files = _walk(startpath)
+
+    modified_files = []
+    # Accumulate counters in locals and write them back once; attribute
+    # increments on the shared Metrics instance per file add up in the
+    # aggregation loop.
+    files_processed = files_modified = files_skipped = errors = 0
+    with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2) as executor:
+        futures = [executor.submit(_process_one, filepath, filepath_str, tree, backup_dir, startpath)
+                   for filepath, filepath_str in files]
+        for future in futures:
+            modified, stats = future.result()
+            if modified:
+                modified_files.append(modified)
+            files_processed += stats['files_processed']
+            files_modified += stats['files_modified']
+            files_skipped += stats['files_skipped']
+            errors += stats['errors']
+
+    with _metrics_lock:
+        metrics.files_processed += files_processed
+        metrics.files_modified += files_modified
+        metrics.files_skipped += files_skipped
+        metrics.errors += errors
 
     return modified_files
 
@@ -268,15 +432,26 @@ def generate_markdown_map(tree: str, output_file: Path):
         logger.error(f"Error generating Markdown map: {str(e)}")
         metrics.errors += 1
 
-def git_commit_changes(modified_files: List[Path]):
+def git_commit_changes(modified_files: List[str]):
     """Commit changes to git repository, handling long file lists."""
     try:
-        # Split the list of files into smaller chunks to avoid command line length limits
-        chunk_size = 100  # Adjust this value as needed
-        for i in range(0, len(modified_files), chunk_size):
-            chunk = modified_files[i:i + chunk_size]
-            subprocess.run(["git", "add"] + [str(f) for f in chunk], check=True)
-        
+        try:
+            # Feed all paths to a single git add over stdin, NUL-separated,
+            # instead of spawning one subprocess per argv-sized chunk.
+            paths = b'\0'.join(os.fsencode(f) for f in modified_files)
+            subprocess.run(
+                ["git", "add", "--pathspec-from-file=-", "--pathspec-file-nul"],
+                input=paths, check=True,
+            )
+        except subprocess.CalledProcessError:
+            # git older than 2.25 lacks --pathspec-from-file; fall back to
+            # chunked argv to stay under command line length limits.
+            logger.warning("git add --pathspec-from-file failed, falling back to chunked git add")
+            chunk_size = 100  # Adjust this value as needed
+            for i in range(0, len(modified_files), chunk_size):
+                chunk = modified_files[i:i + chunk_size]
+                subprocess.run(["git", "add"] + chunk, check=True)
+
         subprocess.run(["git", "commit", "-m", "Update repository map"], check=True)
         logger.info("Changes committed to git repository")
     except subprocess.CalledProcessError as e:
@@ -285,41 +460,73 @@ def git_commit_changes(modified_files: List[Path]):
 
 MAX_PATH_LENGTH = 260  # Increased to a more reasonable limit
 
-def create_backup(filepath: Path, backup_dir: Path, startpath: Path) -> Optional[Path]:
-    """Create a backup of the given file."""
+def _copy_file_fast(src: Path, dst: Path):
+    """Copy src to dst with metadata, using in-kernel os.sendfile when available.
+
+    sendfile moves the data without userspace round-trips; platforms
+    without it (Windows) fall back to shutil.copy2.
+    """
+    if not hasattr(os, 'sendfile'):
+        shutil.copy2(src, dst)
+        return
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            src_fd = fsrc.fileno()
+            dst_fd = fdst.fileno()
+            remaining = os.fstat(src_fd).st_size
+            offset = 0
+            while remaining > 0:
+                sent = os.sendfile(dst_fd, src_fd, offset, remaining)
+                if sent == 0:
+                    break
+                offset += sent
+                remaining -= sent
+        shutil.copystat(src, dst)
+    except OSError:
+        # Some filesystems reject sendfile; let shutil pick a working path.
+        shutil.copy2(src, dst)
+
+def create_backup(filepath: Path, backup_dir: Path, startpath: Path,
+                  filepath_str: Optional[str] = None) -> Optional[Path]:
+    """Create a backup of the given file.
+
+    filepath_str is the cached string form of filepath (as yielded by
+    _walk) so the Path never has to be re-stringified here.
+    """
     try:
+        if filepath_str is None:
+            filepath_str = str(filepath)
         relative_path = filepath.relative_to(startpath)
         backup_path = backup_dir / relative_path
-        
+
         logger.debug(f"Attempting to create backup for: {filepath}")
         logger.debug(f"Relative path for backup: {relative_path}")
         logger.debug(f"Initial backup path: {backup_path}")
 
-        if '.tree_map_backup' in str(filepath):
+        # The walker already filtered excluded files before we get here, so
+        # only the backup-directory sentinel needs re-checking.
+        if '.tree_map_backup' in filepath_str:
             logger.info(f"Skipping backup for file already in backup directory: {filepath}")
             return None
-        
-        if should_exclude(filepath, startpath):
-            logger.info(f"Skipping backup for excluded file: {filepath}")
-            return None
-        
+
         if len(str(backup_path)) > MAX_PATH_LENGTH:
             logger.warning(f"Backup path too long for {filepath}. Using alternative backup method.")
-            import hashlib
-            hash_name = hashlib.md5(str(filepath).encode()).hexdigest()
+            hash_name = hashlib.blake2b(filepath_str.encode(), digest_size=8).hexdigest()
             backup_path = backup_dir / f"{hash_name}{filepath.suffix}"
         
         logger.debug(f"Final backup path: {backup_path}")
         
         backup_path.parent.mkdir(parents=True, exist_ok=True)
         
-        shutil.copy2(filepath, backup_path)
-        metrics.backup_size += filepath.stat().st_size
+        _copy_file_fast(filepath, backup_path)
+        with _metrics_lock:
+            metrics.backup_size += filepath.stat().st_size
         logger.info(f"Backup created: {backup_path}")
         return backup_path
     except Exception as e:
         logger.error(f"Failed to create backup for {filepath}: {str(e)}")
-        metrics.errors += 1
+        with _metrics_lock:
+            metrics.errors += 1
         return None
 
 def generate_tree(startpath: Path) -> str:
@@ -327,18 +534,20 @@ def generate_tree(startpath: Path) -> str:
     tree = []
     startpath = startpath.resolve()
 
-    def add_to_tree(path: Path, prefix: str = ''):
+    def add_to_tree(path, prefix: str = ''):
         nonlocal tree
         files = []
         dirs = []
 
-        for item in sorted(path.iterdir()):
-            if should_exclude(item, startpath):
-                continue
-            if item.is_file():
-                files.append(item.name)
-            elif item.is_dir():
-                dirs.append(item)
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not _excluded_dir_name(entry.name):
+                    dirs.append(entry)
+            elif entry.is_file(follow_symlinks=False):
+                if not _excluded_file_name(entry.name):
+                    files.append(entry.name)
 
         for i, file in enumerate(files):
             if i == len(files) - 1 and not dirs:
@@ -349,24 +558,11 @@ def generate_tree(startpath: Path) -> str:
         for i, dir in enumerate(dirs):
             is_last = (i == len(dirs) - 1)
             tree.append(f"{prefix}{'└── ' if is_last else '├── '}{dir.name}/")
-            add_to_tree(dir, prefix + ('    ' if is_last else '│   '))
+            add_to_tree(dir.path, prefix + ('    ' if is_last else '│   '))
 
     tree.append(f"{startpath.name}/")
     add_to_tree(startpath)
 
-    # Add the final curved lines
-    if len(tree) > 1:
-        last_lines = []
-        for line in reversed(tree):
-            if line.startswith('└── '):
-                last_lines.append(line)
-            else:
-                break
-        
-        for i, line in enumerate(reversed(last_lines)):
-            indent = '    ' * i
-            tree[len(tree) - i - 1] = f"{indent}└── {line.split('└── ', 1)[1]}"
-
     return '\n'.join(tree)
 
 def generate_map_file(tree: str, output_file: Path):
@@ -409,12 +605,12 @@ def main():
 
         if args.update_files:
             logger.info("Previewing changes...")
-            changes = [f for f in current_dir.rglob('*') if f.is_file() and not should_exclude(f, current_dir) and not is_binary_file(f)]
-            
-            for change in changes:
-                print(f"Would update repo map in: {change}")
-            
-            if not changes:
+            candidates = [(f, f_str) for f, f_str in _walk(current_dir) if not is_binary_file(f)]
+
+            for _, candidate_str in candidates:
+                print(f"Would update repo map in: {candidate_str}")
+
+            if not candidates:
                 logger.info("No files to update. Exiting.")
                 return
 
@@ -429,7 +625,7 @@ def main():
                         logger.info(f"Created backup directory: {backup_dir}")
 
                 logger.info("Updating files with new tree map...")
-                modified_files = update_files_with_tree(current_dir, tree, backup_dir)
+                modified_files = update_files_with_tree(current_dir, tree, backup_dir, files=candidates)
 
                 if modified_files:
                     logger.info(f"Updated {len(modified_files)} files.")